@@ -19,7 +19,7 @@ import torch.nn.functional as F
 import torch.optim as optim
 from torch.utils.data import DataLoader
 import copy
-from MRL_Major.On_CB_model.on_magent_model import MA_CB_RP_Major, CB_Encoder
+from MRL_Major.On_CB_model.on_magent_model import MA_CB_RP_Major, CB_Encoder, COMPILE_MODES
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 # device = torch.device('cpu')
@@ -271,7 +271,9 @@ def train_pdptw(args, up_station, all_station, travel_time_G, Loc_x, Loc_y, up_d
                     train_data.update_time_window_state,
                     train_data.update_station_tw_od,
                     args.num_layers,
-                    args.dropout).to(device)
+                    args.dropout,
+                    args.compile,
+                    args.bf16).to(device)
 
     critic = StateCritic(STATIC_SIZE, DYNAMIC_SIZE, args.hidden_size).to(device)
     kwargs = vars(args)
@@ -390,6 +392,9 @@ if __name__ == '__main__':
     parser.add_argument('--hidden', dest='hidden_size', default=128, type=int)
     parser.add_argument('--dropout', default=0.1, type=float)
     parser.add_argument('--layers', dest='num_layers', default=1, type=int)
+    parser.add_argument('--compile', nargs='?', const=True, default=False,
+                        choices=COMPILE_MODES)  # optionally a torch.compile mode
+    parser.add_argument('--bf16', action='store_true', default=False)
     parser.add_argument('--train-size',default=64000, type=int)
     parser.add_argument('--valid-size', default=1280, type=int)
     parser.add_argument('--testing-size', default=128, type=int)
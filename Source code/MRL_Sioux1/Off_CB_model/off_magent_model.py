@@ -1,4 +1,5 @@
 import copy
+import operator
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -178,7 +179,7 @@ class MA_CB_RP_Sioux1(nn.Module):
             for a_idx in range(1, self.agent_number):
                 decision_list[ns].append([dynamic0[a_idx-1][ns][7][0].item(), a_idx])
         for so in range(len(decision_list)):  # Decision ranking
-            list.sort(decision_list[so], key=(lambda x: [x[0]]))
+            decision_list[so].sort(key=operator.itemgetter(0))
         batch_size, input_size, sequence_size = static.size()
         # decoder_input_list = [decoder_input for i in range(self.agent_number)]
         decoder_input1 = decoder_input
@@ -763,7 +764,7 @@ class MA_CB_RP_Sioux1(nn.Module):
                             mask5[visit_idx_mask5, 0] = 1
                             mask5[visit_idx_mask5, 1:] = 0
             for so in range(len(decision_list)):
-                list.sort(decision_list[so], key=(lambda x: [x[0]]))
+                decision_list[so].sort(key=operator.itemgetter(0))
         for a_id0 in range(1, self.agent_number):
             tour_idx[a_id0] = torch.cat(tour_idx[a_id0], dim=1)
             tour_logp[a_id0] = torch.cat(tour_logp[a_id0], dim=1)